@@ -2,21 +2,75 @@ import numpy as np
 import psutil
 import pandas as pd
 from collections import deque
+from operator import itemgetter
 import logging
+import weakref
 from datetime import datetime
-from sklearn.preprocessing import StandardScaler
-from tensorflow.keras.models import Model
-from tensorflow.keras.layers import Input, Dense
-from tensorflow.keras.optimizers import Adam
+
+try:
+    from numba import njit, prange
+except ImportError:
+    njit = None
+
+
+if njit is not None:
+    @njit(parallel=True, fastmath=True, cache=True)
+    def _squared_error(diff, out):
+        n, d = diff.shape
+        for i in prange(n):
+            s = 0.0
+            for j in range(d):
+                s += diff[i, j] * diff[i, j]
+            out[i] = s
+else:
+    def _squared_error(diff, out):
+        np.einsum('ij,ij->i', diff, diff, out=out)
+
+
+_FEATURE_KEYS = ('cpu_percent', 'memory_percent', 'num_threads', 'num_connections', 'num_files')
+_FEATURES = itemgetter(*_FEATURE_KEYS)
+
+
+def metrics_to_array(metrics):
+    """Pack per-process metric dicts into an (n, 5) float32 feature matrix"""
+    rows = [_FEATURES(proc) for proc in metrics]
+    return np.asarray(rows, dtype=np.float32).reshape(-1, len(_FEATURE_KEYS))
+
+
+# Threshold checks behind an anomaly reason, in the order they are reported.
+# _REASON_COLUMNS maps each check onto the feature matrix column order.
+_REASON_FEATURES = itemgetter('cpu_percent', 'memory_percent', 'num_connections', 'num_threads', 'num_files')
+_REASON_COLUMNS = [0, 1, 3, 2, 4]
+_REASON_LIMITS = np.array([80, 80, 50, 100, 100], dtype=np.float32)
+_REASONS = np.array([
+    "High CPU usage",
+    "High memory usage",
+    "Unusual network activity",
+    "High thread count",
+    "Many open files"
+])
+
 
 class AdvancedAnomalyDetector:
-    def __init__(self, history_size=100):
+    def __init__(self, history_size=100, n_components=3):
         self.history_size = history_size
+        self.n_components = n_components
         self.process_history = deque(maxlen=history_size)
-        self.scaler = StandardScaler()
-        self.autoencoder = None
+        self.current_metrics = None
+        # Processes that refused connections() / open_files(); entries vanish
+        # once psutil stops holding the Process object
+        self._denied_conn = weakref.WeakSet()
+        self._denied_files = weakref.WeakSet()
+        self._scale_mean = None
+        self._inv_scale = None
+        self.components_ = None
+        self.mean_ = None
+        self._residual_op = None
+        self._score_weight = None
+        self._score_bias = None
         self.is_trained = False
         self.reconstruction_threshold = None
+        self._threshold_sse = None
 
         # Initialize logging
         logging.basicConfig(
@@ -25,71 +79,119 @@ class AdvancedAnomalyDetector:
             format='%(asctime)s - %(levelname)s - %(message)s'
         )
 
-    def collect_process_metrics(self):
-        """Collect detailed metrics for all running processes"""
-        process_metrics = []
-        for proc in psutil.process_iter(['pid', 'name', 'cpu_percent', 'memory_percent', 'num_threads']):
-            try:
-                pinfo = proc.info
+    def process_metrics(self, proc):
+        """Collect detector metrics for a single psutil.Process"""
+        with proc.oneshot():
+            denied_conn = proc in self._denied_conn
+            denied_files = proc in self._denied_files
+            if (denied_conn or denied_files) and not proc.is_running():
+                # The pid was reused since the denial was recorded, so query
+                # the new process; is_running() also queues the stale Process
+                # for eviction on the next process_iter()
+                self._denied_conn.discard(proc)
+                self._denied_files.discard(proc)
+                denied_conn = denied_files = False
+
+            if denied_conn:
+                num_connections = 0
+            else:
                 try:
                     num_connections = len(proc.connections(kind='inet'))
-                except (psutil.AccessDenied, psutil.ZombieProcess):
+                except psutil.AccessDenied:
+                    self._denied_conn.add(proc)
+                    num_connections = 0
+                except psutil.ZombieProcess:
                     num_connections = 0
 
+            if denied_files:
+                num_files = 0
+            else:
                 try:
                     num_files = len(proc.open_files())
-                except (psutil.AccessDenied, psutil.ZombieProcess):
+                except psutil.AccessDenied:
+                    self._denied_files.add(proc)
+                    num_files = 0
+                except psutil.ZombieProcess:
                     num_files = 0
 
-                metrics = {
-                    'pid': pinfo['pid'],
-                    'name': pinfo['name'],
-                    'cpu_percent': pinfo.get('cpu_percent', 0) or 0,
-                    'memory_percent': pinfo.get('memory_percent', 0) or 0,
-                    'num_threads': pinfo.get('num_threads', 0) or 0,
-                    'num_connections': num_connections,
-                    'num_files': num_files
-                }
+            # as_dict keeps a denied field from dropping the whole process
+            pinfo = proc.as_dict(attrs=['name', 'cpu_percent', 'memory_percent', 'num_threads'], ad_value=0)
 
-                process_metrics.append(metrics)
+            return {
+                'pid': proc.pid,
+                'name': pinfo['name'],
+                'cpu_percent': pinfo['cpu_percent'] or 0,
+                'memory_percent': pinfo['memory_percent'] or 0,
+                'num_threads': pinfo['num_threads'] or 0,
+                'num_connections': num_connections,
+                'num_files': num_files
+            }
 
+    def collect_process_metrics(self):
+        """Collect detailed metrics for all running processes"""
+        process_metrics = []
+        for proc in psutil.process_iter():
+            try:
+                process_metrics.append(self.process_metrics(proc))
             except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess) as e:
                 logging.warning(f"Error collecting metrics for process: {e}")
                 continue
 
         return process_metrics
 
-    def update_history(self):
-        current_metrics = self.collect_process_metrics()
-        self.process_history.append(current_metrics)
+    def update_history(self, current_metrics=None):
+        """Append a snapshot to the history, scanning processes unless one is supplied"""
+        if current_metrics is None:
+            current_metrics = self.collect_process_metrics()
+        self.process_history.append(metrics_to_array(current_metrics))
+        self.current_metrics = current_metrics
         logging.info(f"Updated process history. Current size: {len(self.process_history)}")
+        return current_metrics
 
     def prepare_training_data(self):
         if not self.process_history:
             return None
 
-        all_data = []
-        for metrics in self.process_history:
-            for proc in metrics:
-                all_data.append([
-                    proc['cpu_percent'],
-                    proc['memory_percent'],
-                    proc['num_threads'],
-                    proc['num_connections'],
-                    proc['num_files']
-                ])
-
-        return np.array(all_data)
-
-    def build_autoencoder(self, input_dim):
-        inp = Input(shape=(input_dim,))
-        x = Dense(16, activation='relu')(inp)
-        x = Dense(8, activation='relu')(x)
-        x = Dense(16, activation='relu')(x)
-        out = Dense(input_dim, activation='linear')(x)
-        model = Model(inputs=inp, outputs=out)
-        model.compile(optimizer=Adam(learning_rate=0.001), loss='mse')
-        return model
+        return np.concatenate(self.process_history, axis=0)
+
+    def fit_scaler(self, data):
+        """Fit per-feature standardisation, treating constant features as unit scale"""
+        # Accumulate in float64: a constant float32 column can otherwise show
+        # a tiny spurious std and blow up its inverse scale
+        mean = data.mean(axis=0, dtype=np.float64)
+        std = data.std(axis=0, dtype=np.float64)
+        std[std < 10 * np.finfo(np.float64).eps * np.maximum(1.0, np.abs(mean))] = 1.0
+        self._scale_mean = mean.astype(np.float32)
+        self._inv_scale = (1.0 / std).astype(np.float32)
+
+    def scale(self, data):
+        scaled_data = np.subtract(data, self._scale_mean, dtype=np.float32)
+        scaled_data *= self._inv_scale
+        return scaled_data
+
+    def fit_components(self, scaled_data):
+        """Fit the principal subspace used to reconstruct process metrics"""
+        mean = scaled_data.mean(axis=0)
+        _, _, vt = np.linalg.svd(scaled_data - mean, full_matrices=False)
+        self.mean_ = mean.astype(np.float32)
+        self.components_ = vt[:self.n_components].astype(np.float32)
+
+        # Fold project-and-reconstruct into one float32 residual operator
+        identity = np.eye(self.components_.shape[1], dtype=np.float32)
+        self._residual_op = identity - self.components_.T @ self.components_
+
+    def compile_scorer(self):
+        """Fuse scaling, centring and the residual projection into one affine map"""
+        self._score_weight = self._inv_scale[:, None] * self._residual_op
+        self._score_bias = (self._scale_mean * self._inv_scale + self.mean_) @ self._residual_op
+
+    def squared_error(self, data):
+        """Summed (not averaged) squared reconstruction error of each raw feature row"""
+        diff = data @ self._score_weight
+        diff -= self._score_bias
+        error = np.empty(len(diff), dtype=np.float32)
+        _squared_error(diff, error)
+        return error
 
     def train_model(self):
         data = self.prepare_training_data()
@@ -98,45 +200,39 @@ class AdvancedAnomalyDetector:
             return False
 
         try:
-            scaled_data = self.scaler.fit_transform(data)
-            input_dim = scaled_data.shape[1]
-            self.autoencoder = self.build_autoencoder(input_dim)
-            self.autoencoder.fit(scaled_data, scaled_data, epochs=50, batch_size=32, verbose=0)
-            reconstructed = self.autoencoder.predict(scaled_data)
-            reconstruction_error = np.mean(np.square(scaled_data - reconstructed), axis=1)
-            self.reconstruction_threshold = np.percentile(reconstruction_error, 95)
+            self.fit_scaler(data)
+            scaled_data = self.scale(data)
+            self.fit_components(scaled_data)
+            self.compile_scorer()
+            # Scoring compares the summed error against _threshold_sse;
+            # reconstruction_threshold stays the public per-feature mean value
+            squared_error = self.squared_error(data)
+            self._threshold_sse = np.percentile(squared_error, 95)
+            self.reconstruction_threshold = self._threshold_sse / data.shape[1]
             self.is_trained = True
-            logging.info("Successfully trained autoencoder-based anomaly detection model")
+            logging.info("Successfully trained PCA-based anomaly detection model")
             return True
         except Exception as e:
-            logging.error(f"Error training autoencoder: {e}")
+            logging.error(f"Error training PCA model: {e}")
             return False
 
     def detect_anomalies(self, processes):
-        if not self.is_trained or self.autoencoder is None:
-            logging.warning("Autoencoder model not trained")
+        if not self.is_trained or self.components_ is None:
+            logging.warning("PCA model not trained")
             return []
 
         try:
-            current_data = []
-            for proc in processes:
-                current_data.append([
-                    proc['cpu_percent'],
-                    proc['memory_percent'],
-                    proc['num_threads'],
-                    proc['num_connections'],
-                    proc['num_files']
-                ])
-
-            scaled_data = self.scaler.transform(current_data)
-            reconstructed = self.autoencoder.predict(scaled_data)
-            reconstruction_error = np.mean(np.square(scaled_data - reconstructed), axis=1)
+            current_data = metrics_to_array(processes)
+
+            squared_error = self.squared_error(current_data)
+
+            anomalous = np.nonzero(squared_error > self._threshold_sse)[0]
+            flags = current_data[anomalous][:, _REASON_COLUMNS] > _REASON_LIMITS
 
             anomalies = []
-            for i, err in enumerate(reconstruction_error):
-                if err > self.reconstruction_threshold:
-                    processes[i]['anomaly_reason'] = self.get_anomaly_reason(processes[i])
-                    anomalies.append(processes[i])
+            for i, flagged in zip(anomalous, flags):
+                processes[i]['anomaly_reason'] = self.format_reason(flagged)
+                anomalies.append(processes[i])
 
             logging.info(f"Detected {len(anomalies)} anomalous processes")
             return anomalies
@@ -146,35 +242,29 @@ class AdvancedAnomalyDetector:
             return []
 
     def get_anomaly_reason(self, process):
-        reasons = []
-        if process['cpu_percent'] > 80:
-            reasons.append("High CPU usage")
-        if process['memory_percent'] > 80:
-            reasons.append("High memory usage")
-        if process['num_connections'] > 50:
-            reasons.append("Unusual network activity")
-        if process['num_threads'] > 100:
-            reasons.append("High thread count")
-        if process['num_files'] > 100:
-            reasons.append("Many open files")
-        return ", ".join(reasons) if reasons else "Unusual behavior pattern"
+        values = np.array(_REASON_FEATURES(process), dtype=np.float32)
+        return self.format_reason(values > _REASON_LIMITS)
+
+    def format_reason(self, flags):
+        reasons = _REASONS[flags]
+        return ", ".join(reasons) if len(reasons) else "Unusual behavior pattern"
 
     def generate_report(self, anomalies):
         report = {
             'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
             'total_processes': len(self.process_history[-1]) if self.process_history else 0,
             'anomaly_count': len(anomalies),
-            'anomalies': []
+            'anomalies': [
+                {
+                    'id': proc['pid'],
+                    'sensor': proc['name'],
+                    'reason': proc['anomaly_reason'],
+                    'sensor_01': proc['cpu_percent'],
+                    'sensor_02': proc['memory_percent'],
+                    'connections': proc['num_connections']
+                }
+                for proc in anomalies
+            ]
         }
 
-        for proc in anomalies:
-            report['anomalies'].append({
-                'id': proc['pid'],
-                'sensor': proc['name'],
-                'reason': proc['anomaly_reason'],
-                'sensor_01': proc['cpu_percent'],
-                'sensor_02': proc['memory_percent'],
-                'connections': proc['num_connections']
-            })
-
         return report
@@ -1,26 +1,35 @@
 import sys
+import re
 import time
 import psutil
 import platform
+from collections import deque
 from datetime import datetime
+from operator import itemgetter
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, 
-                            QTableWidget, QTableWidgetItem, QPushButton, QLabel,
+                            QTableView, QPushButton, QLabel,
                             QHeaderView, QHBoxLayout, QMessageBox, QSizePolicy)
-from PyQt5.QtCore import QTimer, Qt, QRunnable, QThreadPool, pyqtSlot, QObject, pyqtSignal
+from PyQt5.QtCore import (QTimer, Qt, QRunnable, QThreadPool, pyqtSlot, QObject, pyqtSignal,
+                          QAbstractTableModel, QModelIndex)
 from PyQt5.QtGui import QColor
 import matplotlib.pyplot as plt
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
 from advanced_anomaly_detector import AdvancedAnomalyDetector
 import json
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 class WorkerSignals(QObject):
     finished = pyqtSignal(dict)
 
 class StatsWorker(QRunnable):
-    def __init__(self, callback):
+    def __init__(self, signals, detector):
         super().__init__()
-        self.signals = WorkerSignals()
-        self.signals.finished.connect(callback)
+        self.signals = signals
+        self.detector = detector
 
     @pyqtSlot()
     def run(self):
@@ -28,35 +37,120 @@ class StatsWorker(QRunnable):
             cpu_percent = psutil.cpu_percent(interval=0.1)
             memory = psutil.virtual_memory()
             processes = []
+            metrics = []
 
-            for proc in psutil.process_iter(['pid', 'name', 'username', 'cpu_percent', 'status', 'create_time', 'cmdline']):
+            for proc in psutil.process_iter():
                 try:
-                    pinfo = proc.info
-                    memory_mb = proc.memory_info().rss / 1024 / 1024
-                    created = datetime.fromtimestamp(pinfo['create_time']).strftime('%Y-%m-%d %H:%M:%S')
-
-                    processes.append({
-                        'pid': pinfo['pid'],
-                        'name': pinfo['name'],
-                        'username': pinfo.get('username', 'N/A'),
-                        'cpu': pinfo['cpu_percent'],
-                        'memory': memory_mb,
-                        'status': pinfo['status'],
-                        'created': created,
-                        'cmdline': pinfo.get('cmdline', [])
-                    })
+                    with proc.oneshot():
+                        # The detector reads cpu_percent() first; calling it
+                        # again here would measure a near-zero interval
+                        proc_metrics = self.detector.process_metrics(proc)
+                        metrics.append(proc_metrics)
+
+                        try:
+                            username = proc.username()
+                        except psutil.AccessDenied:
+                            username = 'N/A'
+
+                        try:
+                            cmdline = proc.cmdline()
+                        except psutil.AccessDenied:
+                            cmdline = []
+
+                        memory_mb = proc.memory_info().rss / 1024 / 1024
+                        created = datetime.fromtimestamp(proc.create_time()).strftime('%Y-%m-%d %H:%M:%S')
+
+                        processes.append({
+                            'pid': proc.pid,
+                            'name': proc_metrics['name'],
+                            'username': username,
+                            'cpu': proc_metrics['cpu_percent'],
+                            'memory': memory_mb,
+                            'status': proc.status(),
+                            'created': created,
+                            'cmdline': cmdline
+                        })
                 except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
                     continue
 
             self.signals.finished.emit({
                 'cpu_percent': cpu_percent,
                 'memory': memory,
-                'processes': processes
+                'processes': processes,
+                'metrics': metrics
             })
 
         except Exception as e:
             print("Error in background worker:", e)
 
+class ProcessTableModel(QAbstractTableModel):
+    """Process rows for the table view; cells are formatted only when Qt asks for them"""
+    HEADERS = ["ID", "Sensor", "Station", "Sensor_01", "Sensor_02", "Status", "Date Online"]
+    KEYS = ['pid', 'name', 'username', 'cpu', 'memory', 'status', 'created']
+    SUSPICIOUS_BACKGROUND = QColor("#8B0000")
+    SUSPICIOUS_FOREGROUND = QColor("#ffffff")
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.processes = []
+        self.sort_column = None
+        self.sort_order = Qt.AscendingOrder
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.processes)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.HEADERS[section]
+        return super().headerData(section, orientation, role)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+
+        process = self.processes[index.row()]
+        if role == Qt.DisplayRole:
+            key = self.KEYS[index.column()]
+            if key in ('cpu', 'memory'):
+                return f"{process[key]:.1f}"
+            return str(process[key])
+        if process['suspicious']:
+            if role == Qt.BackgroundRole:
+                return self.SUSPICIOUS_BACKGROUND
+            if role == Qt.ForegroundRole:
+                return self.SUSPICIOUS_FOREGROUND
+        return None
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        self.sort_column, self.sort_order = column, order
+        self._relayout(self.processes)
+
+    def set_processes(self, processes):
+        self._relayout(processes)
+
+    def _relayout(self, processes):
+        """Swap in sorted rows, moving persistent indexes (e.g. the selection) with their pid"""
+        self.layoutAboutToBeChanged.emit()
+        old_indexes = self.persistentIndexList()
+        old_pids = [self.processes[index.row()]['pid'] for index in old_indexes]
+
+        if self.sort_column is not None:
+            processes.sort(key=itemgetter(self.KEYS[self.sort_column]),
+                           reverse=self.sort_order == Qt.DescendingOrder)
+        self.processes = processes
+
+        rows = {process['pid']: row for row, process in enumerate(processes)}
+        new_indexes = [
+            self.index(rows[pid], index.column()) if pid in rows else QModelIndex()
+            for pid, index in zip(old_pids, old_indexes)
+        ]
+        self.changePersistentIndexList(old_indexes, new_indexes)
+        self.layoutChanged.emit()
+
+
 class ProcessMonitorUI(QMainWindow):
     def __init__(self):
         super().__init__()
@@ -69,6 +163,7 @@ class ProcessMonitorUI(QMainWindow):
             "wireshark", "john", "hashcat", "strace", "lsof",
             "gdb", "radare2", "pkexec", "iotop"
         ]
+        self.suspicious_regex = re.compile('|'.join(map(re.escape, self.suspicious_patterns)))
 
         main_widget = QWidget()
         self.setCentralWidget(main_widget)
@@ -80,17 +175,15 @@ class ProcessMonitorUI(QMainWindow):
         header_layout.addWidget(self.system_info_label)
         layout.addLayout(header_layout)
 
-        self.process_table = QTableWidget()
-        self.process_table.setColumnCount(7)
-        self.process_table.setHorizontalHeaderLabels([
-            "ID", "Sensor", "Station", "Sensor_01", "Sensor_02", "Status", "Date Online"
-        ])
+        self.process_model = ProcessTableModel(self)
+        self.process_table = QTableView()
+        self.process_table.setModel(self.process_model)
         self.process_table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
         self.process_table.setAlternatingRowColors(True)
         self.process_table.setSortingEnabled(True)
         self.process_table.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
         self.process_table.setStyleSheet("""
-            QTableWidget {
+            QTableView {
                 gridline-color: #d3d3d3;
                 background-color: white;
                 alternate-background-color: #f6f6f6;
@@ -107,6 +200,23 @@ class ProcessMonitorUI(QMainWindow):
         self.figure, (self.cpu_ax, self.mem_ax) = plt.subplots(2, 1, figsize=(8, 6))
         self.canvas = FigureCanvas(self.figure)
 
+        self.cpu_line, = self.cpu_ax.plot([], [], 'b-', label='Sensor_01')
+        self.cpu_ax.set_ylabel('Sensor_01 (%)')
+        self.cpu_ax.set_title('Sensor_01 Readout')
+        self.cpu_ax.set_ylim(0, 100)
+        self.cpu_ax.grid(True)
+        self.cpu_ax.legend()
+
+        self.mem_line, = self.mem_ax.plot([], [], 'r-', label='Sensor_02')
+        self.mem_ax.set_xlabel('Time (s)')
+        self.mem_ax.set_ylabel('Sensor_02 (%)')
+        self.mem_ax.set_title('Sensor_02 Readout')
+        self.mem_ax.set_ylim(0, 100)
+        self.mem_ax.grid(True)
+        self.mem_ax.legend()
+
+        self.figure.tight_layout()
+
         control_layout = QHBoxLayout()
         self.refresh_button = QPushButton("Refresh")
         self.refresh_button.setObjectName("refresh_button")
@@ -139,21 +249,22 @@ class ProcessMonitorUI(QMainWindow):
         self.status_label.setStyleSheet("color: #666; font-style: italic;")
         layout.addWidget(self.status_label)
 
-        self.cpu_history = []
-        self.mem_history = []
-        self.time_points = []
+        self.cpu_history = deque(maxlen=50)
+        self.mem_history = deque(maxlen=50)
+        self.time_points = deque(maxlen=50)
         self.start_time = time.time()
 
         self.timer = QTimer()
         self.timer.timeout.connect(self.update_data)
         self.threadpool = QThreadPool()
+        self.worker_signals = WorkerSignals()
+        self.worker_signals.finished.connect(self.on_data_ready)
 
         self.update_data()
 
     def is_suspicious(self, name, cmdline):
-        name = name.lower()
-        cmdline = ' '.join(cmdline).lower() if cmdline else ''
-        return any(pattern in name or pattern in cmdline for pattern in self.suspicious_patterns)
+        text = f"{name} {' '.join(cmdline)}" if cmdline else name
+        return self.suspicious_regex.search(text.lower()) is not None
 
     def toggle_auto_refresh(self, checked):
         if checked:
@@ -164,7 +275,7 @@ class ProcessMonitorUI(QMainWindow):
             self.refresh_button.setEnabled(True)
 
     def update_data(self):
-        worker = StatsWorker(self.on_data_ready)
+        worker = StatsWorker(self.worker_signals, self.anomaly_detector)
         self.threadpool.start(worker)
 
     def on_data_ready(self, data):
@@ -177,36 +288,12 @@ class ProcessMonitorUI(QMainWindow):
         for proc in data['processes']:
             proc['suspicious'] = self.is_suspicious(proc['name'], proc['cmdline'])
 
+        self.anomaly_detector.update_history(data['metrics'])
         self.update_process_table(data['processes'])
         self.update_resource_graphs(data['cpu_percent'], data['memory'].percent)
 
     def update_process_table(self, processes):
-        self.process_table.setSortingEnabled(False)
-        self.process_table.setRowCount(len(processes))
-
-        for row, process in enumerate(processes):
-            items = [
-                QTableWidgetItem(str(process['pid'])),
-                QTableWidgetItem(process['name']),
-                QTableWidgetItem(process['username']),
-                QTableWidgetItem(f"{process['cpu']:.1f}"),
-                QTableWidgetItem(f"{process['memory']:.1f}"),
-                QTableWidgetItem(process['status']),
-                QTableWidgetItem(process['created'])
-            ]
-
-            for item in items:
-                item.setFlags(item.flags() & ~Qt.ItemIsEditable)
-
-            if process['suspicious']:
-                for item in items:
-                    item.setBackground(QColor("#8B0000"))
-                    item.setForeground(QColor("#ffffff"))
-
-            for col, item in enumerate(items):
-                self.process_table.setItem(row, col, item)
-
-        self.process_table.setSortingEnabled(True)
+        self.process_model.set_processes(processes)
 
     def update_resource_graphs(self, cpu_percent, mem_percent):
         current_time = time.time() - self.start_time
@@ -215,29 +302,14 @@ class ProcessMonitorUI(QMainWindow):
         self.cpu_history.append(cpu_percent)
         self.mem_history.append(mem_percent)
 
-        if len(self.time_points) > 50:
-            self.time_points.pop(0)
-            self.cpu_history.pop(0)
-            self.mem_history.pop(0)
-
-        self.cpu_ax.clear()
-        self.mem_ax.clear()
-
-        self.cpu_ax.plot(self.time_points, self.cpu_history, 'b-', label='Sensor_01')
-        self.cpu_ax.set_ylabel('Sensor_01 (%)')
-        self.cpu_ax.set_title('Sensor_01 Readout')
-        self.cpu_ax.grid(True)
-        self.cpu_ax.legend()
+        self.cpu_line.set_data(self.time_points, self.cpu_history)
+        self.mem_line.set_data(self.time_points, self.mem_history)
 
-        self.mem_ax.plot(self.time_points, self.mem_history, 'r-', label='Sensor_02')
-        self.mem_ax.set_xlabel('Time (s)')
-        self.mem_ax.set_ylabel('Sensor_02 (%)')
-        self.mem_ax.set_title('Sensor_02 Readout')
-        self.mem_ax.grid(True)
-        self.mem_ax.legend()
+        for ax in (self.cpu_ax, self.mem_ax):
+            ax.relim()
+            ax.autoscale_view(scaley=False)
 
-        self.figure.tight_layout()
-        self.canvas.draw()
+        self.canvas.draw_idle()
 
     def save_resource_snapshot(self):
         try:
@@ -252,7 +324,11 @@ class ProcessMonitorUI(QMainWindow):
 
     def check_anomalies(self):
         try:
-            self.anomaly_detector.update_history()
+            # Refreshes already feed the history; only scan if none has landed yet
+            current_metrics = self.anomaly_detector.current_metrics
+            if current_metrics is None:
+                current_metrics = self.anomaly_detector.update_history()
+
             if not self.anomaly_detector.is_trained:
                 self.status_label.setText("Training anomaly detection model...")
                 self.status_label.setStyleSheet("color: #2196F3;")
@@ -260,13 +336,16 @@ class ProcessMonitorUI(QMainWindow):
                     self.status_label.setText("Need more data to train model")
                     return
 
-            current_metrics = self.anomaly_detector.collect_process_metrics()
             anomalies = self.anomaly_detector.detect_anomalies(current_metrics)
             report = self.anomaly_detector.generate_report(anomalies)
 
             report_file = f'anomaly_report_{datetime.now().strftime("%Y%m%d_%H%M%S")}.json'
-            with open(report_file, 'w') as f:
-                json.dump(report, f, indent=2)
+            if orjson is not None:
+                with open(report_file, 'wb') as f:
+                    f.write(orjson.dumps(report, option=orjson.OPT_INDENT_2))
+            else:
+                with open(report_file, 'w') as f:
+                    json.dump(report, f, indent=2)
 
             self.status_label.setText(
                 f"Found {len(anomalies)} anomalous processes. Report saved to {report_file}"